@@ -7,6 +7,7 @@ from flask import Flask, request, jsonify, render_template, send_file, abort
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
+import threading
 import time
 import uuid
 from datetime import datetime, timedelta
@@ -21,6 +22,14 @@ from filters import (
     validate_image, 
     image_to_bytes
 )
+from dedup import (
+    PerceptualIndex,
+    color_distance,
+    compute_fingerprint,
+    filter_spec_key,
+    is_informative_hash
+)
+from storage import create_storage
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -30,36 +39,174 @@ CORS(app)
 app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024  # 20MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['PROCESSED_FOLDER'] = 'processed'
+app.config['STORAGE_BACKEND'] = 'local'  # 'local' (sharded PROCESSED_FOLDER) or 's3'
+app.config['S3_BUCKET'] = None  # Bucket shared by all API nodes (s3 backend)
+app.config['S3_PREFIX'] = 'processed'
+app.config['S3_ENDPOINT_URL'] = None  # Set for S3-compatible servers such as MinIO
+app.config['CLEANUP_ENABLED'] = True  # Disable on all but one node sharing storage
+app.config['CLEANUP_INTERVAL'] = 300  # Seconds between background cleanup passes
+app.config['STATS_CACHE_TTL'] = 60  # Seconds before /stats triggers a background storage rescan
 app.config['SECRET_KEY'] = 'vision-api-secret-key-change-in-production'
+app.config['ASYNC_WORKERS'] = os.cpu_count() or 4  # Filter threads in async (ASGI) mode
+app.config['ASYNC_IO_WORKERS'] = 4  # Disk I/O threads in async (ASGI) mode
+app.config['DEDUP_ENABLED'] = False  # Reuse results for near-identical uploads
+app.config['DEDUP_MAX_DISTANCE'] = 4  # Max Hamming distance between perceptual hashes
+app.config['DEDUP_MAX_ENTRIES'] = 100000  # Recent results kept in the dedup index
+app.config['DEDUP_MAX_COLOR_DIFF'] = 6.0  # Max mean per-channel difference of colour thumbnails (0-255)
 
 # Supported image formats
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'webp'}
 
 # Create necessary directories
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['PROCESSED_FOLDER'], exist_ok=True)
 os.makedirs('static', exist_ok=True)
 
+# Processed-image storage (built from config on first use)
+STORAGE_CONFIG_KEYS = ('STORAGE_BACKEND', 'PROCESSED_FOLDER', 'S3_BUCKET', 'S3_PREFIX', 'S3_ENDPOINT_URL')
+storage = None
+storage_settings = None
+storage_lock = threading.Lock()
+
+# Background cleanup and cached storage usage
+last_cleanup_time = 0.0
+cleanup_schedule_lock = threading.Lock()
+cleanup_running = threading.Lock()
+usage_cache = {"time": None, "value": (0, 0)}  # Set by background scans only
+usage_refresh_running = threading.Lock()
+
+# Perceptual-hash index of recent results (built from config on first use)
+dedup_index = None
+dedup_index_lock = threading.Lock()
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_storage():
+    """Return the processed-image storage, rebuilding it if its config has changed"""
+    global storage, storage_settings
+    
+    settings = tuple(app.config.get(key) for key in STORAGE_CONFIG_KEYS)
+    with storage_lock:
+        if storage is None or settings != storage_settings:
+            storage = create_storage(app.config)
+            storage_settings = settings
+        return storage
+
+def set_processed_usage(usage):
+    """Record a (count, size) figure measured by a full scan"""
+    usage_cache["value"] = usage
+    usage_cache["time"] = time.time()
+
+def refresh_processed_usage():
+    """Scan storage and record its usage (background thread)"""
+    if not usage_refresh_running.acquire(blocking=False):
+        return  # A scan is already running
+    try:
+        set_processed_usage(get_storage().usage())
+    except Exception as e:
+        print(f"Error measuring storage usage: {e}")
+    finally:
+        usage_refresh_running.release()
+
+def get_processed_usage():
+    """
+    Return ((count, size), measured_at) for processed files without scanning
+
+    The figure comes from the last background scan (cleanup pass or usage
+    refresh). Once it is older than STATS_CACHE_TTL, a refresh is started
+    in the background; until the first scan finishes the figure is (0, 0)
+    with measured_at None.
+    """
+    measured_at = usage_cache["time"]
+    if measured_at is None or time.time() - measured_at >= app.config['STATS_CACHE_TTL']:
+        if not usage_refresh_running.locked():
+            threading.Thread(target=refresh_processed_usage, name='vision-usage', daemon=True).start()
+    return usage_cache["value"], measured_at
+
+def schedule_cleanup():
+    """Start cleanup_old_files in a background thread, at most once per CLEANUP_INTERVAL"""
+    global last_cleanup_time
+    
+    if not app.config['CLEANUP_ENABLED']:
+        return
+    with cleanup_schedule_lock:
+        if time.time() - last_cleanup_time < app.config['CLEANUP_INTERVAL']:
+            return
+        last_cleanup_time = time.time()
+    
+    threading.Thread(target=cleanup_old_files, name='vision-cleanup', daemon=True).start()
+
 def cleanup_old_files():
     """Clean up files older than 1 hour"""
+    if not cleanup_running.acquire(blocking=False):
+        return  # A previous pass is still running
+    
     try:
         cutoff_time = datetime.now() - timedelta(hours=1)
         
-        for folder in [app.config['UPLOAD_FOLDER'], app.config['PROCESSED_FOLDER']]:
-            for filename in os.listdir(folder):
-                file_path = os.path.join(folder, filename)
-                if os.path.isfile(file_path):
-                    file_time = datetime.fromtimestamp(os.path.getctime(file_path))
-                    if file_time < cutoff_time:
-                        os.remove(file_path)
-                        print(f"Cleaned up old file: {filename}")
+        folder = app.config['UPLOAD_FOLDER']
+        for filename in os.listdir(folder):
+            file_path = os.path.join(folder, filename)
+            if os.path.isfile(file_path):
+                file_time = datetime.fromtimestamp(os.path.getctime(file_path))
+                if file_time < cutoff_time:
+                    os.remove(file_path)
+                    print(f"Cleaned up old file: {filename}")
+        
+        removed, usage = get_storage().sweep(cutoff_time.timestamp())
+        set_processed_usage(usage)
+        for filename in removed:
+            print(f"Cleaned up old file: {filename}")
     except Exception as e:
         print(f"Error during cleanup: {e}")
+    finally:
+        cleanup_running.release()
+
+def get_dedup_index():
+    """Return the dedup index, rebuilding it if its config has changed"""
+    global dedup_index
+    
+    max_distance = app.config['DEDUP_MAX_DISTANCE']
+    max_entries = app.config['DEDUP_MAX_ENTRIES']
+    with dedup_index_lock:
+        if dedup_index is None or \
+                (dedup_index.max_distance, dedup_index.max_entries) != (max_distance, max_entries):
+            dedup_index = PerceptualIndex(max_distance=max_distance, max_entries=max_entries)
+        return dedup_index
+
+def find_dedup_result(phash, spec, signature, size):
+    """Load an earlier result for a near-identical upload, scaled down to `size`"""
+    max_color_diff = app.config['DEDUP_MAX_COLOR_DIFF']
+    
+    def accept(value):
+        _, original_size, stored_signature = value
+        # Only scale results down; upscaling a smaller result loses detail
+        if original_size[0] < size[0] or original_size[1] < size[1]:
+            return False
+        # Resized copies keep their aspect ratio; anything else is a different image
+        if abs(original_size[0] * size[1] - original_size[1] * size[0]) > 0.01 * original_size[0] * size[1]:
+            return False
+        # dHash ignores colour; confirm the thumbnails agree
+        return color_distance(signature, stored_signature) <= max_color_diff
+    
+    index = get_dedup_index()
+    match = index.lookup(phash, spec, accept=accept)
+    if match is None:
+        return None
+
+    entry_id, distance, (processed_filename, _, _) = match
+
+    try:
+        with Image.open(io.BytesIO(get_storage().get(processed_filename))) as stored:
+            stored.load()
+            if stored.size != size:
+                return stored.resize(size, Image.Resampling.LANCZOS)
+            return stored.copy()
+    except Exception:
+        index.discard(entry_id)  # Result was cleaned up or is unreadable
+        return None
 
 def get_file_info(file_path):
     """Get file information"""
@@ -219,17 +366,27 @@ def process_image():
             except ValueError:
                 return jsonify({"error": "Invalid sharpen factor"}), 400
         
+        # Reuse an earlier result for a near-identical upload
+        filtered_image = None
+        dedup_key = None  # (hash, filter spec, colour signature) when dedup applies
+        if app.config['DEDUP_ENABLED']:
+            phash, signature = compute_fingerprint(image)
+            if is_informative_hash(phash):
+                dedup_key = (phash, filter_spec_key(filter_name, filter_params), signature)
+                filtered_image = find_dedup_result(*dedup_key, image.size)
+        deduplicated = filtered_image is not None
+        
         # Apply filter
-        try:
-            filtered_image = apply_filter(image, filter_name, **filter_params)
-        except ValueError as e:
-            return jsonify({"error": f"Filter processing failed: {str(e)}"}), 400
+        if not deduplicated:
+            try:
+                filtered_image = apply_filter(image, filter_name, **filter_params)
+            except ValueError as e:
+                return jsonify({"error": f"Filter processing failed: {str(e)}"}), 400
         
         # Generate unique filename
         file_id = str(uuid.uuid4())
         original_ext = file.filename.rsplit('.', 1)[1].lower()
         processed_filename = f"{file_id}_{filter_name}.{original_ext}"
-        processed_path = os.path.join(app.config['PROCESSED_FOLDER'], processed_filename)
         
         # Save processed image
         try:
@@ -239,19 +396,22 @@ def process_image():
                 output_format = 'PNG'
                 
             processed_bytes = image_to_bytes(filtered_image, format=output_format)
-            
-            with open(processed_path, 'wb') as f:
-                f.write(processed_bytes)
+            get_storage().put(processed_filename, processed_bytes)
                 
         except Exception as e:
             return jsonify({"error": f"Failed to save processed image: {str(e)}"}), 500
         
+        # Only index results filtered from scratch, so reuse never chains resizes
+        if dedup_key is not None and not deduplicated:
+            phash, spec, signature = dedup_key
+            get_dedup_index().add(phash, spec, (processed_filename, image.size, signature))
+        
         # Calculate processing time
         processing_time = round((time.time() - start_time) * 1000, 2)  # milliseconds
         
-        # Clean up old files (async)
+        # Clean up old files (in the background)
         try:
-            cleanup_old_files()
+            schedule_cleanup()
         except Exception:
             pass  # Don't fail the request if cleanup fails
         
@@ -265,7 +425,8 @@ def process_image():
             "processing_time": processing_time,
             "original_size": f"{image.size[0]}x{image.size[1]}",
             "output_format": output_format,
-            "file_size": len(processed_bytes)
+            "file_size": len(processed_bytes),
+            "deduplicated": deduplicated
         })
         
     except Exception as e:
@@ -282,9 +443,13 @@ def download_processed_image(filename):
     try:
         # Security: ensure filename is safe
         filename = secure_filename(filename)
-        file_path = os.path.join(app.config['PROCESSED_FOLDER'], filename)
         
-        if not os.path.exists(file_path):
+        # Local backends serve the file from disk; remote ones from bytes
+        backend = get_storage()
+        try:
+            file_path = backend.local_path(filename)
+            file_data = None if file_path else backend.get(filename)
+        except (KeyError, ValueError):
             abort(404)
         
         # Get format from query parameter
@@ -295,7 +460,7 @@ def download_processed_image(filename):
         if output_format in ['JPEG', 'PNG'] and (output_format.lower() not in filename.lower()):
             try:
                 # Load and convert image
-                with Image.open(file_path) as img:
+                with Image.open(file_path or io.BytesIO(file_data)) as img:
                     converted_bytes = image_to_bytes(img, format=output_format)
                 
                 # Create response
@@ -320,8 +485,16 @@ def download_processed_image(filename):
                 return jsonify({"error": f"Format conversion failed: {str(e)}"}), 500
         
         # Serve original processed file
+        if file_path:
+            return send_file(
+                file_path,
+                as_attachment=download,
+                download_name=filename if download else None
+            )
+        
         return send_file(
-            file_path,
+            io.BytesIO(file_data),
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
             as_attachment=download,
             download_name=filename if download else None
         )
@@ -336,8 +509,7 @@ def get_stats():
     try:
         upload_count = len([f for f in os.listdir(app.config['UPLOAD_FOLDER']) 
                            if os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], f))])
-        processed_count = len([f for f in os.listdir(app.config['PROCESSED_FOLDER']) 
-                              if os.path.isfile(os.path.join(app.config['PROCESSED_FOLDER'], f))])
+        (processed_count, processed_size), usage_measured_at = get_processed_usage()
         
         # Calculate total file sizes
         def get_folder_size(folder):
@@ -349,7 +521,6 @@ def get_stats():
             return total
         
         upload_size = get_folder_size(app.config['UPLOAD_FOLDER'])
-        processed_size = get_folder_size(app.config['PROCESSED_FOLDER'])
         
         return jsonify({
             "timestamp": datetime.now().isoformat(),
@@ -361,6 +532,9 @@ def get_stats():
             "storage": {
                 "uploads_size_mb": round(upload_size / 1024 / 1024, 2),
                 "processed_size_mb": round(processed_size / 1024 / 1024, 2),
+                "processed_measured_at": (
+                    datetime.fromtimestamp(usage_measured_at).isoformat() if usage_measured_at else None
+                ),
                 "total_size_mb": round((upload_size + processed_size) / 1024 / 1024, 2)
             },
             "filters": {
@@ -399,11 +573,12 @@ def internal_error(e):
 
 if __name__ == '__main__':
     # Run cleanup on startup
-    try:
-        cleanup_old_files()
-        print("✅ Startup cleanup completed")
-    except Exception as e:
-        print(f"⚠️ Startup cleanup failed: {e}")
+    if app.config['CLEANUP_ENABLED']:
+        try:
+            cleanup_old_files()
+            print("✅ Startup cleanup completed")
+        except Exception as e:
+            print(f"⚠️ Startup cleanup failed: {e}")
     
     print("🚀 Starting Vision API Server...")
     print("=" * 50)
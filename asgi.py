@@ -0,0 +1,312 @@
+"""
+Vision API - ASGI Front-end
+Async serving mode: network I/O runs on the event loop, Flask work on a bounded executor
+
+Run with:  uvicorn asgi:application --host 127.0.0.1 --port 5000
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import ClosingIterator, FileWrapper
+
+from app import app
+
+# Request bodies larger than this are spooled to disk while they arrive
+SPOOL_MAX_SIZE = 1024 * 1024  # 1MB
+
+# File responses are read from disk in blocks of this size
+STREAM_BLOCK_SIZE = 256 * 1024  # 256KB
+
+
+class StreamedFile(FileWrapper):
+    """wsgi.file_wrapper that reads send_file bodies in STREAM_BLOCK_SIZE blocks"""
+
+    def __init__(self, file, buffer_size: int = STREAM_BLOCK_SIZE):
+        super().__init__(file, max(buffer_size, STREAM_BLOCK_SIZE))
+
+
+class AsyncVisionApp:
+    """
+    ASGI wrapper around the Flask app.
+
+    Uploads are read from the client on the event loop before any thread is
+    involved, so a slow or idle connection holds no worker. Once the whole
+    request is buffered, the Flask app runs on a bounded thread pool (filters
+    are CPU-bound), and its response is written back on the event loop so a
+    slow download does not hold a worker either. Routes, status codes and
+    JSON bodies are exactly those of the Flask app.
+
+    Disk I/O (spooled uploads, streamed file responses) runs on a small
+    separate pool, so downloads keep moving while every filter worker is busy.
+
+    Memory: each in-flight upload is buffered (spooled to disk above
+    SPOOL_MAX_SIZE). File responses (send_file, including Range responses)
+    are streamed in STREAM_BLOCK_SIZE blocks and stop when the client
+    disconnects; other responses are already in memory in Flask and are
+    sent as they are.
+    """
+
+    def __init__(self, flask_app, max_workers: int = None, io_workers: int = None):
+        self.flask_app = flask_app
+        self.max_workers = max_workers or flask_app.config.get('ASYNC_WORKERS') or os.cpu_count() or 4
+        self.io_workers = io_workers or flask_app.config.get('ASYNC_IO_WORKERS') or 4
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='vision-worker'
+        )
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=self.io_workers,
+            thread_name_prefix='vision-io'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.handle_http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.handle_lifespan(receive, send)
+        elif scope['type'] == 'websocket':
+            # No websocket endpoints: reject the handshake
+            message = await receive()
+            if message['type'] == 'websocket.connect':
+                await send({'type': 'websocket.close', 'code': 1000})
+
+    async def handle_lifespan(self, receive, send):
+        """Handle server startup/shutdown events"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # Let in-flight jobs finish without blocking the loop
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, self.executor.shutdown, True)
+                await loop.run_in_executor(None, self.io_executor.shutdown, True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_http(self, scope, receive, send):
+        """Buffer the request, run Flask on the executor, stream the response"""
+        loop = asyncio.get_running_loop()
+        max_length = self.flask_app.config.get('MAX_CONTENT_LENGTH')
+
+        declared_length = self.declared_length(scope)
+        if max_length is not None and declared_length is not None and declared_length > max_length:
+            # Refuse before reading any of the body
+            await self.send_response(send, *self.too_large_response(scope))
+            return
+
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        try:
+            body_size = await self.read_body(receive, body)
+            if body_size is None:
+                return  # Client went away before finishing the upload
+
+            if max_length is not None and body_size > max_length:
+                await self.send_response(send, *self.too_large_response(scope))
+                return
+
+            environ = self.build_environ(scope, body, body_size)
+            status, headers, result = await loop.run_in_executor(
+                self.executor, self.run_wsgi, environ
+            )
+        finally:
+            body.close()
+
+        if isinstance(result, list):
+            await self.send_response(send, status, headers, result)
+            return
+
+        # Streamed file response: stop reading as soon as the client goes away
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            iterator = iter(result)
+            while not disconnected.done():
+                block = await loop.run_in_executor(self.io_executor, next, iterator, None)
+                if block is None:
+                    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                    break
+                if block and not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': block, 'more_body': True})
+        finally:
+            disconnected.cancel()
+            if hasattr(result, 'close'):
+                result.close()
+
+    async def send_response(self, send, status: int, headers: list, chunks: list):
+        """Send a response whose body is already in memory"""
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': False})
+
+    async def wait_for_disconnect(self, receive):
+        """Return once the client has disconnected"""
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    @staticmethod
+    def declared_length(scope):
+        """Return the request's Content-Length header as an int, if valid"""
+        for name, value in scope.get('headers', []):
+            if name.lower() == b'content-length':
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+        return None
+
+    async def read_body(self, receive, body):
+        """
+        Read the request body into a spooled file
+
+        Chunks that would take the body past SPOOL_MAX_SIZE (i.e. once it
+        lives on disk) are written on the I/O pool, not the event loop.
+
+        Returns:
+            Number of bytes received, or None if the client disconnected.
+            Reading stops once MAX_CONTENT_LENGTH is exceeded; the returned
+            size is then over the limit.
+        """
+        loop = asyncio.get_running_loop()
+        max_length = self.flask_app.config.get('MAX_CONTENT_LENGTH')
+        size = 0
+        more_body = True
+
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if max_length is not None and size > max_length:
+                break
+            if size > SPOOL_MAX_SIZE:
+                await loop.run_in_executor(self.io_executor, body.write, chunk)
+            else:
+                body.write(chunk)
+            more_body = message.get('more_body', False)
+
+        body.seek(0)
+        return size
+
+    def too_large_response(self, scope):
+        """
+        Build the app's 413 response without running a worker
+
+        Uses the Flask app's own 413 handler and after_request hooks
+        (e.g. CORS headers), so the JSON matches the sync server.
+        """
+        headers = {
+            name.decode('latin-1'): value.decode('latin-1')
+            for name, value in scope.get('headers', [])
+        }
+        with self.flask_app.test_request_context(
+            scope['path'], method=scope['method'], headers=headers
+        ):
+            rv = self.flask_app.handle_http_exception(RequestEntityTooLarge())
+            response = self.flask_app.finalize_request(rv)
+
+        return response.status_code, [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in response.headers.items()
+        ], [response.get_data()]
+
+    def build_environ(self, scope, body, body_size: int) -> dict:
+        """Translate an ASGI HTTP scope into a WSGI environ"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(body_size),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.file_wrapper': StreamedFile,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if name == 'CONTENT_LENGTH':
+                continue  # Use the number of bytes actually received
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+        return environ
+
+    def run_wsgi(self, environ: dict):
+        """
+        Run the Flask app (executor thread)
+
+        Buffered Flask responses are returned as a list of chunks; file
+        responses (send_file, Range) are returned unread for handle_http
+        to stream.
+        """
+        response = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers
+            ]
+            return chunks.append
+
+        result = self.flask_app(environ, start_response)
+        if not isinstance(result, (ClosingIterator, list)) and not chunks:
+            return response['status'], response['headers'], result
+
+        try:
+            for chunk in result:
+                if chunk:
+                    chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        return response['status'], response['headers'], chunks
+
+
+application = AsyncVisionApp(app)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        print("⚠️ uvicorn is required for async mode: pip install uvicorn")
+        sys.exit(1)
+
+    print("🚀 Starting Vision API Server (async mode)...")
+    print("=" * 50)
+    print("📱 Web Interface: http://127.0.0.1:5000")
+    print(f"🧵 Filter Workers: {application.max_workers}")
+    print("=" * 50)
+
+    uvicorn.run(application, host='127.0.0.1', port=5000)
@@ -0,0 +1,64 @@
+"""
+Lookup benchmark for the perceptual-hash dedup index
+Fills a PerceptualIndex with random hashes and times lookups for near
+matches (a few flipped bits) and misses.
+
+Usage:  python benchmarks/bench_dedup_index.py [--entries 1000000] [--distance 4]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import HASH_BITS, PerceptualIndex, filter_spec_key
+
+
+def flip_bits(phash: int, count: int) -> int:
+    """Flip `count` random bits of a hash"""
+    for position in random.sample(range(HASH_BITS), count):
+        phash ^= 1 << position
+    return phash
+
+
+def time_lookups(index, queries, spec) -> float:
+    """Return the mean lookup time in microseconds"""
+    start = time.perf_counter()
+    for phash in queries:
+        index.lookup(phash, spec)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--distance', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    spec = filter_spec_key('blur', {'radius': 2.0})
+    index = PerceptualIndex(max_distance=args.distance, max_entries=args.entries)
+
+    start = time.perf_counter()
+    hashes = [random.getrandbits(HASH_BITS) for _ in range(args.entries)]
+    for i, phash in enumerate(hashes):
+        index.add(phash, spec, i)
+    print(f"Built index of {len(index)} entries in {time.perf_counter() - start:.1f}s")
+
+    near = [flip_bits(random.choice(hashes), random.randint(0, args.distance))
+            for _ in range(args.queries)]
+    misses = [random.getrandbits(HASH_BITS) for _ in range(args.queries)]
+
+    found = sum(index.lookup(phash, spec) is not None for phash in near)
+    print(f"Near matches found: {found}/{args.queries}")
+    print(f"Near-match lookup: {time_lookups(index, near, spec):.1f} us")
+    print(f"Miss lookup:       {time_lookups(index, misses, spec):.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Slow-client benchmark for the Vision API
+Compares threads held by the sync (Werkzeug, thread per connection) server
+and the async (uvicorn + asgi.application) server while many clients trickle
+uploads to POST /process.
+
+Usage:  python benchmarks/bench_slow_clients.py [--clients 50] [--delay 0.05]
+Requires uvicorn for the async run.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from werkzeug.serving import make_server
+
+from app import app
+from asgi import application
+
+HOST = '127.0.0.1'
+BOUNDARY = 'visionapibenchboundary'
+
+
+def build_upload() -> bytes:
+    """Build a multipart POST /process request with a small PNG"""
+    image = Image.effect_noise((256, 256), 64).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+
+    body = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="filter"\r\n\r\n'
+        "grayscale\r\n"
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="image"; filename="bench.png"\r\n'
+        "Content-Type: image/png\r\n\r\n"
+    ).encode() + buffer.getvalue() + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+    head = (
+        "POST /process HTTP/1.1\r\n"
+        f"Host: {HOST}\r\n"
+        f"Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode()
+    return head + body
+
+
+async def slow_client(port: int, payload: bytes, chunk_size: int, delay: float) -> bool:
+    """Trickle the upload in small chunks, then read the whole response"""
+    reader, writer = await asyncio.open_connection(HOST, port)
+    for offset in range(0, len(payload), chunk_size):
+        writer.write(payload[offset:offset + chunk_size])
+        await writer.drain()
+        await asyncio.sleep(delay)
+    response = await reader.read()
+    writer.close()
+    return response.startswith(b'HTTP/1.1 200')
+
+
+class ThreadSampler:
+    """Record the peak number of live threads in this process"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_clients(port: int, args, payload: bytes) -> dict:
+    """Run all slow clients against a server and measure threads/time"""
+    start = time.time()
+
+    async def main():
+        return await asyncio.gather(*[
+            slow_client(port, payload, args.chunk_size, args.delay)
+            for _ in range(args.clients)
+        ])
+
+    with ThreadSampler() as sampler:
+        baseline = threading.active_count()
+        results = asyncio.run(main())
+
+    return {
+        'ok': sum(results),
+        'peak_extra_threads': sampler.peak - baseline,
+        'wall_time_s': round(time.time() - start, 2)
+    }
+
+
+def bench_sync(args, payload: bytes) -> dict:
+    """Werkzeug threaded server: one thread per connection"""
+    server = make_server(HOST, args.port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        return run_clients(args.port, args, payload)
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def bench_async(args, payload: bytes) -> dict:
+    """uvicorn serving asgi.application: event loop + bounded executor"""
+    import uvicorn
+
+    config = uvicorn.Config(application, host=HOST, port=args.port + 1,
+                            log_level='warning', lifespan='off')
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    # Spin up the executor up front so its threads count in the baseline
+    for _ in range(application.max_workers):
+        application.executor.submit(time.sleep, 0.05)
+    time.sleep(0.1)
+
+    try:
+        return run_clients(args.port + 1, args, payload)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--chunk-size', type=int, default=16 * 1024)
+    parser.add_argument('--delay', type=float, default=0.05, help='Seconds between chunks')
+    parser.add_argument('--port', type=int, default=5100)
+    args = parser.parse_args()
+
+    payload = build_upload()
+    print(f"{args.clients} clients, {len(payload)} byte upload, "
+          f"{args.chunk_size} byte chunks every {args.delay}s")
+
+    # The filter code prints debug info per request; keep the report readable
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sync_result = bench_sync(args, payload)
+        async_result = bench_async(args, payload)
+
+    print(f"{'mode':<8}{'ok':>6}{'peak extra threads':>22}{'wall time (s)':>16}")
+    for mode, result in (('sync', sync_result), ('async', async_result)):
+        print(f"{mode:<8}{result['ok']:>6}{result['peak_extra_threads']:>22}"
+              f"{result['wall_time_s']:>16}")
+
+
+if __name__ == '__main__':
+    main()
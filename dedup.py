@@ -0,0 +1,257 @@
+"""
+Perceptual-hash deduplication for vision_api
+Finds earlier results for near-identical uploads (re-encoded or resized copies)
+"""
+
+from PIL import Image
+from collections import OrderedDict
+from itertools import combinations
+from typing import Callable, Optional, Tuple
+import threading
+import numpy as np
+
+
+HASH_BITS = 64
+# Three ~21-bit chunks keep buckets near one entry at a million entries
+CHUNK_WIDTHS = (22, 21, 21)
+CHUNK_COUNT = len(CHUNK_WIDTHS)
+
+# Hashes with fewer set (or unset) bits than this carry too little structure
+# to identify an image: flat or low-texture images all hash to near 0
+MIN_HASH_BITS = 8
+
+COLOR_SIGNATURE_SIZE = (8, 8)
+
+# Images are reduced so their short side is at least this before hashing
+FINGERPRINT_MIN_SIDE = 64
+
+
+def compute_dhash(image: Image.Image) -> int:
+    """
+    Compute a 64-bit difference hash (dHash) of an image
+
+    The image is shrunk to 9x8 grayscale and each bit records whether a
+    pixel is brighter than its left neighbour, so the hash survives
+    re-encoding and resizing.
+
+    Args:
+        image: PIL Image object
+
+    Returns:
+        Hash as a 64-bit integer
+    """
+    small = image.convert('L').resize((9, 8), Image.Resampling.BOX)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def compute_fingerprint(image: Image.Image) -> Tuple[int, np.ndarray]:
+    """
+    Compute the dHash and colour signature of an image in one pass
+
+    The image is first box-reduced by an integer factor (Image.reduce) to
+    a small RGB copy, so neither function converts the full-resolution
+    image.
+
+    Args:
+        image: PIL Image object
+
+    Returns:
+        (hash, colour signature)
+    """
+    small = image
+    factor = min(image.size) // FINGERPRINT_MIN_SIDE
+    if factor > 1:
+        try:
+            small = image.reduce(factor)
+        except ValueError:
+            pass  # Mode not supported by reduce() (e.g. palette); convert below
+    small = small.convert('RGB')
+    return compute_dhash(small), compute_color_signature(small)
+
+
+def is_informative_hash(phash: int) -> bool:
+    """
+    Check that a hash has enough structure to be matched on
+
+    Args:
+        phash: Hash from compute_dhash
+
+    Returns:
+        False for degenerate (near all-zero or all-one) hashes
+    """
+    return MIN_HASH_BITS <= phash.bit_count() <= HASH_BITS - MIN_HASH_BITS
+
+
+def compute_color_signature(image: Image.Image) -> np.ndarray:
+    """
+    Compute a small RGB thumbnail used to confirm dHash matches
+
+    dHash only sees luminance gradients, so two images with the same
+    structure in different colours hash alike; the thumbnail tells them apart.
+
+    Args:
+        image: PIL Image object
+
+    Returns:
+        8x8x3 uint8 array
+    """
+    return np.asarray(image.convert('RGB').resize(COLOR_SIGNATURE_SIZE, Image.Resampling.BOX))
+
+
+def color_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute per-channel difference between two colour signatures (0-255)"""
+    return float(np.abs(a.astype(np.int16) - b.astype(np.int16)).mean())
+
+
+def filter_spec_key(filter_name: str, filter_params: dict) -> Tuple:
+    """
+    Build a hashable key for a filter and its parameters
+
+    Args:
+        filter_name: Name of the applied filter
+        filter_params: Parameters passed to the filter
+
+    Returns:
+        Tuple identifying the filter spec
+    """
+    return (filter_name,) + tuple(sorted(filter_params.items()))
+
+
+def _flip_masks(width: int, radius: int) -> list:
+    """All XOR masks of `width` bits with at most `radius` bits set"""
+    masks = []
+    for flips in range(radius + 1):
+        for positions in combinations(range(width), flips):
+            masks.append(sum(1 << position for position in positions))
+    return masks
+
+
+class PerceptualIndex:
+    """
+    Bounded multi-index hash of recent results
+
+    Each 64-bit hash is split into three chunks, each with its own bucket
+    table. Two hashes within distance d have at least one chunk within
+    distance d // 3 (pigeonhole), so a lookup only probes the buckets near
+    the query's chunks instead of scanning every entry.
+    The oldest entries are evicted once `max_entries` is reached.
+    """
+
+    def __init__(self, max_distance: int = 4, max_entries: int = 100000):
+        if max_distance < 0:
+            raise ValueError("Maximum Hamming distance must be non-negative")
+        if max_entries < 1:
+            raise ValueError("Index must hold at least one entry")
+
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        radius = max_distance // CHUNK_COUNT
+        self._masks = [_flip_masks(width, radius) for width in CHUNK_WIDTHS]
+        self._entries = OrderedDict()  # entry_id -> (spec, hash, value)
+        self._tables = {}  # spec -> one {chunk: [entry ids]} table per chunk
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _chunks(phash: int) -> list:
+        chunks = []
+        for width in CHUNK_WIDTHS:
+            chunks.append(phash & ((1 << width) - 1))
+            phash >>= width
+        return chunks
+
+    def add(self, phash: int, spec: Tuple, value) -> int:
+        """
+        Add a result to the index
+
+        Args:
+            phash: Perceptual hash of the original upload
+            spec: Filter spec key (see filter_spec_key)
+            value: Data returned by lookup on a match
+
+        Returns:
+            Entry id, usable with discard()
+        """
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+
+            self._entries[entry_id] = (spec, phash, value)
+            tables = self._tables.setdefault(spec, [{} for _ in CHUNK_WIDTHS])
+            for table, chunk in zip(tables, self._chunks(phash)):
+                bucket = table.get(chunk)
+                if bucket is None:
+                    table[chunk] = [entry_id]
+                else:
+                    bucket.append(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+            return entry_id
+
+    def lookup(self, phash: int, spec: Tuple,
+               accept: Callable[[object], bool] = None) -> Optional[Tuple[int, int, object]]:
+        """
+        Find the closest entry with the same spec within max_distance
+
+        Args:
+            phash: Perceptual hash of the new upload
+            spec: Filter spec key (see filter_spec_key)
+            accept: Optional check on an entry's value; rejected entries are skipped
+
+        Returns:
+            (entry_id, distance, value) of the best match, or None.
+            Ties go to the most recent entry.
+        """
+        with self._lock:
+            tables = self._tables.get(spec)
+            if tables is None:
+                return None
+
+            best = None
+            seen = set()
+            entries = self._entries
+
+            for table, masks, chunk in zip(tables, self._masks, self._chunks(phash)):
+                for mask in masks:
+                    bucket = table.get(chunk ^ mask)
+                    if bucket is None:
+                        continue
+                    for entry_id in bucket:
+                        if entry_id in seen:
+                            continue
+                        seen.add(entry_id)
+
+                        distance = (entries[entry_id][1] ^ phash).bit_count()
+                        if distance > self.max_distance:
+                            continue
+                        if best is not None and (distance, -entry_id) >= (best[1], -best[0]):
+                            continue
+                        value = entries[entry_id][2]
+                        if accept is None or accept(value):
+                            best = (entry_id, distance, value)
+
+            return best
+
+    def discard(self, entry_id: int):
+        """Remove an entry (e.g. once its result file is gone)"""
+        with self._lock:
+            if entry_id in self._entries:
+                self._remove(entry_id)
+
+    def _remove(self, entry_id: int):
+        spec, phash, _ = self._entries.pop(entry_id)
+        tables = self._tables[spec]
+        for table, chunk in zip(tables, self._chunks(phash)):
+            bucket = table[chunk]
+            bucket.remove(entry_id)
+            if not bucket:
+                del table[chunk]
+        if not any(tables):
+            del self._tables[spec]
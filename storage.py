@@ -0,0 +1,346 @@
+"""
+Processed-image storage for vision_api
+Pluggable backends: hash-sharded local directories or an S3-compatible bucket
+"""
+
+from typing import Iterator, List, Optional, Tuple
+import hashlib
+import os
+import tempfile
+
+
+def _current_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Mode for new files, as open() would create them (mkstemp uses 0600)
+FILE_MODE = 0o666 & ~_current_umask()
+
+# S3 DeleteObjects accepts at most this many keys per call
+S3_DELETE_BATCH = 1000
+
+
+def shard_prefix(key: str, depth: int = 2) -> str:
+    """
+    Build the shard path for a key from its SHA-1 digest
+
+    Args:
+        key: Object name (e.g. '<uuid>_<filter>.<ext>')
+        depth: Number of two-hex-digit directory levels
+
+    Returns:
+        Prefix like 'ab/cd'
+    """
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return '/'.join(digest[i * 2:i * 2 + 2] for i in range(depth))
+
+
+def _validate_key(key: str):
+    if not key or '/' in key or '\\' in key or key.startswith('.'):
+        raise ValueError(f"Invalid storage key '{key}'")
+
+
+class StorageBackend:
+    """
+    Interface for processed-image storage
+
+    Keys are flat file names; backends decide where they live.
+    get() raises KeyError for missing objects.
+    """
+
+    def put(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Return a filesystem path for the object, if the backend has one"""
+        return None
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        """Yield (key, size in bytes, modified timestamp) for every object"""
+        raise NotImplementedError
+
+    def usage(self) -> Tuple[int, int]:
+        """Return (object count, total size in bytes)"""
+        count = 0
+        total = 0
+        for _, size, _ in self.iter_objects():
+            count += 1
+            total += size
+        return count, total
+
+    def cleanup(self, cutoff: float) -> list:
+        """Delete objects modified before `cutoff` and return their keys"""
+        return self.sweep(cutoff)[0]
+
+    def sweep(self, cutoff: float) -> Tuple[List[str], Tuple[int, int]]:
+        """
+        Delete objects modified before `cutoff` and measure what is left
+
+        One pass over the store does both jobs, so a background cleanup
+        can also refresh usage figures.
+
+        Returns:
+            (removed keys, (remaining object count, remaining size in bytes))
+        """
+        removed = []
+        count = 0
+        total = 0
+        for key, size, modified in self.iter_objects():
+            if modified < cutoff:
+                self.delete(key)
+                removed.append(key)
+            else:
+                count += 1
+                total += size
+        return removed, (count, total)
+
+
+class LocalShardedStorage(StorageBackend):
+    """
+    Local directory split into hash-based shards (root/ab/<key>)
+
+    256 shard directories keep each directory to a few thousand entries at
+    hundreds of thousands of objects, while a full scan only has to open
+    256 directories. Writes go to a temporary file in
+    the target shard and are renamed into place, so readers (and other
+    nodes sharing the directory) never see a partial file.
+
+    Files left directly in the root by the old flat layout are still
+    found, listed and cleaned up, so no migration is needed.
+    """
+
+    TEMP_PREFIX = '.tmp-'
+
+    def __init__(self, root: str, depth: int = 1):
+        self.root = os.path.abspath(root)
+        self.depth = depth
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        """Return the sharded on-disk path for a key"""
+        _validate_key(key)
+        return os.path.join(self.root, shard_prefix(key, self.depth), key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Return the existing file for a key (sharded or legacy flat), or None"""
+        path = self.path(key)
+        if os.path.isfile(path):
+            return path
+        legacy_path = os.path.join(self.root, key)
+        if os.path.isfile(legacy_path):
+            return legacy_path
+        return None
+
+    def put(self, key: str, data: bytes):
+        path = self.path(key)
+        shard_dir = os.path.dirname(path)
+        os.makedirs(shard_dir, exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(dir=shard_dir, prefix=self.TEMP_PREFIX)
+        try:
+            os.fchmod(fd, FILE_MODE)  # Readable by other nodes/users, like open()
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def get(self, key: str) -> bytes:
+        path = self.local_path(key)
+        if path is None:
+            raise KeyError(key)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+    def exists(self, key: str) -> bool:
+        return self.local_path(key) is not None
+
+    def delete(self, key: str):
+        for path in (self.path(key), os.path.join(self.root, key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _scan(self) -> Iterator[Tuple[str, str, int, float]]:
+        """Yield (name, path, size, mtime) for every file, temp files included"""
+        def walk(directory, level):
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                if level < self.depth and entry.is_dir():
+                    yield from walk(entry.path, level + 1)
+                elif entry.is_file():
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # Removed by another node meanwhile
+                    yield entry.name, entry.path, stat.st_size, stat.st_mtime
+
+        yield from walk(self.root, 0)
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        for name, _, size, modified in self._scan():
+            if not name.startswith(self.TEMP_PREFIX):
+                yield name, size, modified
+
+    def sweep(self, cutoff: float) -> Tuple[List[str], Tuple[int, int]]:
+        """Delete objects and orphaned temp files modified before `cutoff`"""
+        removed = []
+        count = 0
+        total = 0
+        for name, path, size, modified in self._scan():
+            is_temp = name.startswith(self.TEMP_PREFIX)
+            if modified >= cutoff:
+                if not is_temp:
+                    count += 1
+                    total += size
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            if not is_temp:
+                removed.append(name)
+        return removed, (count, total)
+
+
+class S3Storage(StorageBackend):
+    """
+    S3-compatible bucket backend (AWS S3, MinIO, ...)
+
+    Keys are stored under '<prefix>/<ab>/<cd>/<key>' so objects spread
+    across key prefixes. PUT is atomic on S3, so several API nodes can
+    share one bucket.
+    """
+
+    def __init__(self, client, bucket: str, prefix: str = 'processed', depth: int = 2):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.depth = depth
+
+    def object_key(self, key: str) -> str:
+        """Return the bucket key for a storage key"""
+        _validate_key(key)
+        parts = [self.prefix] if self.prefix else []
+        return '/'.join(parts + [shard_prefix(key, self.depth), key])
+
+    def _is_missing(self, error) -> bool:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def put(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.object_key(key), Body=data)
+
+    def get(self, key: str) -> bytes:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                raise KeyError(key)
+            raise
+        return response['Body'].read()
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+            return True
+        except Exception as e:
+            if self._is_missing(e):
+                return False
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    def _list(self) -> Iterator[dict]:
+        paginator = self.client.get_paginator('list_objects_v2')
+        list_prefix = f"{self.prefix}/" if self.prefix else ''
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=list_prefix):
+            yield from page.get('Contents', [])
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        for obj in self._list():
+            key = obj['Key'].rsplit('/', 1)[-1]
+            yield key, obj['Size'], obj['LastModified'].timestamp()
+
+    def sweep(self, cutoff: float) -> Tuple[List[str], Tuple[int, int]]:
+        """Delete old objects in DeleteObjects batches of up to 1000 keys"""
+        removed = []
+        count = 0
+        total = 0
+        batch = []
+
+        for obj in self._list():
+            if obj['LastModified'].timestamp() < cutoff:
+                batch.append(obj['Key'])
+                if len(batch) == S3_DELETE_BATCH:
+                    removed.extend(self._delete_batch(batch))
+                    batch = []
+            else:
+                count += 1
+                total += obj['Size']
+
+        if batch:
+            removed.extend(self._delete_batch(batch))
+        return removed, (count, total)
+
+    def _delete_batch(self, object_keys: List[str]) -> List[str]:
+        """Delete up to 1000 bucket keys in one call; return the storage keys removed"""
+        response = self.client.delete_objects(
+            Bucket=self.bucket,
+            Delete={'Objects': [{'Key': key} for key in object_keys], 'Quiet': True}
+        )
+        failed = {error['Key'] for error in response.get('Errors', [])}
+        return [key.rsplit('/', 1)[-1] for key in object_keys if key not in failed]
+
+
+def create_storage(config) -> StorageBackend:
+    """
+    Create the storage backend selected by app config
+
+    Config keys:
+        STORAGE_BACKEND: 'local' (default) or 's3'
+        PROCESSED_FOLDER: root directory for 'local'
+        S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL: settings for 's3'
+
+    Raises:
+        ValueError: If the backend is unknown or misconfigured
+    """
+    backend = config.get('STORAGE_BACKEND', 'local')
+
+    if backend == 'local':
+        return LocalShardedStorage(config['PROCESSED_FOLDER'])
+
+    if backend == 's3':
+        if not config.get('S3_BUCKET'):
+            raise ValueError("S3_BUCKET must be set for the s3 storage backend")
+        try:
+            import boto3
+        except ImportError:
+            raise ValueError("boto3 is required for the s3 storage backend")
+        client = boto3.client('s3', endpoint_url=config.get('S3_ENDPOINT_URL'))
+        return S3Storage(client, config['S3_BUCKET'], prefix=config.get('S3_PREFIX', 'processed'))
+
+    raise ValueError(f"Unknown storage backend '{backend}'. Available: local, s3")
@@ -0,0 +1,121 @@
+"""
+Shared fixtures for vision_api tests
+Includes an in-memory stand-in for an S3 client
+"""
+
+from datetime import datetime, timezone
+import io
+import os
+
+import pytest
+
+
+class FakeClientError(Exception):
+    """Mimics botocore's ClientError (error code in .response)"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakePaginator:
+    """list_objects_v2 paginator returning `page_size` objects per page"""
+
+    def __init__(self, client, page_size: int):
+        self.client = client
+        self.page_size = page_size
+
+    def paginate(self, Bucket, Prefix=''):
+        keys = sorted(key for key in self.client.buckets.get(Bucket, {}) if key.startswith(Prefix))
+        for start in range(0, len(keys), self.page_size):
+            page_keys = keys[start:start + self.page_size]
+            yield {
+                'KeyCount': len(page_keys),
+                'Contents': [
+                    {
+                        'Key': key,
+                        'Size': len(self.client.buckets[Bucket][key][0]),
+                        'LastModified': self.client.buckets[Bucket][key][1]
+                    }
+                    for key in page_keys
+                ]
+            }
+        if not keys:
+            yield {'KeyCount': 0}  # S3 omits 'Contents' for empty listings
+
+
+class InMemoryS3Client:
+    """Dict-backed stand-in for the boto3 S3 client calls used by S3Storage"""
+
+    def __init__(self, page_size: int = 2):
+        self.buckets = {}  # bucket -> {key: (body, last_modified)}
+        self.page_size = page_size
+        self.delete_objects_calls = 0
+        self.fail_deletes = set()  # Keys delete_objects reports as errors
+
+    def put_object(self, Bucket, Key, Body):
+        self.buckets.setdefault(Bucket, {})[Key] = (bytes(Body), datetime.now(timezone.utc))
+
+    def get_object(self, Bucket, Key):
+        try:
+            body, _ = self.buckets[Bucket][Key]
+        except KeyError:
+            raise FakeClientError('NoSuchKey')
+        return {'Body': io.BytesIO(body)}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.buckets.get(Bucket, {}):
+            raise FakeClientError('404')
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        self.buckets.get(Bucket, {}).pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        objects = Delete['Objects']
+        if len(objects) > 1000:
+            raise FakeClientError('MalformedXML')  # S3 rejects more than 1000 keys
+        self.delete_objects_calls += 1
+
+        errors = []
+        for obj in objects:
+            if obj['Key'] in self.fail_deletes:
+                errors.append({'Key': obj['Key'], 'Code': 'AccessDenied'})
+            else:
+                self.buckets.get(Bucket, {}).pop(obj['Key'], None)
+        return {'Errors': errors} if errors else {}
+
+    def get_paginator(self, operation):
+        assert operation == 'list_objects_v2'
+        return FakePaginator(self, self.page_size)
+
+    def set_last_modified(self, Bucket, Key, timestamp: float):
+        """Test helper: backdate an object"""
+        body, _ = self.buckets[Bucket][Key]
+        self.buckets[Bucket][Key] = (body, datetime.fromtimestamp(timestamp, timezone.utc))
+
+
+@pytest.fixture
+def s3_client():
+    return InMemoryS3Client()
+
+
+@pytest.fixture(scope='session')
+def flask_app(tmp_path_factory):
+    """The Flask app, with its upload/processed folders in a temp directory"""
+    root = tmp_path_factory.mktemp('app')
+    cwd = os.getcwd()
+    os.chdir(root)  # app.py creates its folders relative to the cwd on import
+    try:
+        from app import app
+    finally:
+        os.chdir(cwd)
+
+    app.config.update(
+        TESTING=True,
+        UPLOAD_FOLDER=str(root / 'uploads'),
+        PROCESSED_FOLDER=str(root / 'processed'),
+        CLEANUP_ENABLED=False
+    )
+    return app
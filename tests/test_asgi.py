@@ -0,0 +1,208 @@
+"""
+Tests for the ASGI front-end (asgi.AsyncVisionApp)
+"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+
+KEY = 'streamed_invert.jpeg'
+
+
+@pytest.fixture
+def asgi_app(flask_app):
+    from asgi import AsyncVisionApp
+
+    application = AsyncVisionApp(flask_app, max_workers=2, io_workers=2)
+    yield application
+    application.executor.shutdown()
+    application.io_executor.shutdown()
+
+
+@pytest.fixture
+def stored_file(flask_app):
+    """A 1MB object in processed storage, served as-is (no format conversion)"""
+    from app import get_storage
+
+    data = os.urandom(1024 * 1024)
+    get_storage().put(KEY, data)
+    yield data
+    get_storage().delete(KEY)
+
+
+def make_scope(method='GET', path='/', query=b'', headers=()):
+    return {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query,
+        'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        'http_version': '1.1',
+        'scheme': 'http',
+        'server': ('testserver', 80),
+        'client': ('10.0.0.1', 4321),
+    }
+
+
+def call(application, scope, body_chunks=(b'',), disconnect_after_start=False):
+    """
+    Run one request through the ASGI app
+
+    Returns:
+        (status, headers dict, list of body messages)
+    """
+    async def run():
+        messages = [
+            {'type': 'http.request', 'body': chunk, 'more_body': i < len(body_chunks) - 1}
+            for i, chunk in enumerate(body_chunks)
+        ]
+        started = asyncio.Event()
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            if disconnect_after_start:
+                await started.wait()
+                return {'type': 'http.disconnect'}
+            await asyncio.Event().wait()  # Client stays connected
+
+        async def send(message):
+            sent.append(message)
+            if message['type'] == 'http.response.start':
+                started.set()
+
+        await application(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    start = sent[0]
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in start['headers']}
+    return start['status'], headers, sent[1:]
+
+
+def body_of(messages) -> bytes:
+    return b''.join(message.get('body', b'') for message in messages)
+
+
+def test_build_environ(asgi_app):
+    scope = make_scope(
+        method='POST',
+        path='/café',
+        query=b'format=PNG&download=true',
+        headers=[
+            ('Content-Type', 'multipart/form-data; boundary=x'),
+            ('Content-Length', '999'),
+            ('Accept', 'image/png'),
+            ('Accept', 'image/jpeg'),
+            ('X-Request-Id', 'abc'),
+        ]
+    )
+
+    environ = asgi_app.build_environ(scope, body=None, body_size=12)
+
+    assert environ['REQUEST_METHOD'] == 'POST'
+    assert environ['PATH_INFO'] == '/café'.encode('utf-8').decode('latin-1')
+    assert environ['QUERY_STRING'] == 'format=PNG&download=true'
+    assert environ['CONTENT_TYPE'] == 'multipart/form-data; boundary=x'
+    assert environ['CONTENT_LENGTH'] == '12'  # Bytes received, not the header
+    assert environ['HTTP_ACCEPT'] == 'image/png,image/jpeg'
+    assert environ['HTTP_X_REQUEST_ID'] == 'abc'
+    assert environ['SERVER_NAME'] == 'testserver'
+    assert environ['REMOTE_ADDR'] == '10.0.0.1'
+    assert 'HTTP_CONTENT_LENGTH' not in environ
+
+
+def test_json_endpoint(asgi_app):
+    status, headers, messages = call(asgi_app, make_scope(path='/filters'))
+
+    assert status == 200
+    assert headers['content-type'] == 'application/json'
+    assert json.loads(body_of(messages))['count'] == 5
+
+
+def test_oversized_body_gets_413_with_cors(asgi_app, flask_app, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'MAX_CONTENT_LENGTH', 100)
+    scope = make_scope(method='POST', path='/process', headers=[('Origin', 'http://example.com')])
+
+    status, headers, messages = call(asgi_app, scope, body_chunks=[b'x' * 60, b'x' * 60])
+
+    assert status == 413
+    assert json.loads(body_of(messages))['error'] == 'File too large'
+    assert headers['access-control-allow-origin'] == 'http://example.com'
+
+
+def test_declared_oversized_body_rejected_before_reading(asgi_app, flask_app, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'MAX_CONTENT_LENGTH', 100)
+    scope = make_scope(method='POST', path='/process', headers=[('Content-Length', '5000')])
+
+    async def receive():
+        raise AssertionError("body should not be read")
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+
+    assert sent[0]['status'] == 413
+
+
+def test_file_response_is_streamed_in_blocks(asgi_app, stored_file):
+    from asgi import STREAM_BLOCK_SIZE
+
+    status, headers, messages = call(asgi_app, make_scope(path=f"/processed/{KEY}"))
+
+    assert status == 200
+    assert body_of(messages) == stored_file
+    assert len(messages) > 1
+    assert all(len(message['body']) <= STREAM_BLOCK_SIZE for message in messages)
+    assert messages[-1]['more_body'] is False
+
+
+def test_head_request(asgi_app, stored_file):
+    status, headers, messages = call(asgi_app, make_scope(method='HEAD', path=f"/processed/{KEY}"))
+
+    assert status == 200
+    assert headers['content-length'] == str(len(stored_file))
+    assert body_of(messages) == b''
+
+
+def test_range_request(asgi_app, stored_file):
+    scope = make_scope(path=f"/processed/{KEY}", headers=[('Range', 'bytes=100-299')])
+
+    status, headers, messages = call(asgi_app, scope)
+
+    assert status == 206
+    assert headers['content-range'] == f"bytes 100-299/{len(stored_file)}"
+    assert body_of(messages) == stored_file[100:300]
+
+
+def test_streaming_stops_on_disconnect(asgi_app, stored_file):
+    from asgi import STREAM_BLOCK_SIZE
+
+    status, _, messages = call(
+        asgi_app, make_scope(path=f"/processed/{KEY}"), disconnect_after_start=True
+    )
+
+    assert status == 200
+    assert len(body_of(messages)) < len(stored_file)
+    assert len(messages) < len(stored_file) // STREAM_BLOCK_SIZE
+
+
+def test_websocket_is_closed(asgi_app):
+    sent = []
+
+    async def receive():
+        return {'type': 'websocket.connect'}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app({'type': 'websocket', 'path': '/'}, receive, send))
+
+    assert sent == [{'type': 'websocket.close', 'code': 1000}]
@@ -0,0 +1,206 @@
+"""
+Tests for the perceptual-hash dedup index and its use in /process
+"""
+
+import io
+import random
+
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+from dedup import (
+    CHUNK_WIDTHS,
+    PerceptualIndex,
+    compute_fingerprint,
+    filter_spec_key,
+    is_informative_hash
+)
+
+
+SPEC = filter_spec_key('blur', {'radius': 2.0})
+BASE = 0x5A5A_F0F0_3C3C_9696
+
+
+def chunk_bit(chunk: int, offset: int) -> int:
+    """Bit position of `offset` within chunk number `chunk`"""
+    return sum(CHUNK_WIDTHS[:chunk]) + offset
+
+
+def flip_spread(phash: int, count: int) -> int:
+    """Flip `count` bits spread round-robin across all chunks"""
+    for i in range(count):
+        phash ^= 1 << chunk_bit(i % len(CHUNK_WIDTHS), i // len(CHUNK_WIDTHS))
+    return phash
+
+
+@pytest.mark.parametrize('max_distance', [0, 2, 3, 4, 5, 8])
+def test_match_at_max_distance_across_all_chunks(max_distance):
+    index = PerceptualIndex(max_distance=max_distance)
+    entry_id = index.add(BASE, SPEC, 'result')
+
+    query = flip_spread(BASE, max_distance)
+    assert (query ^ BASE).bit_count() == max_distance
+
+    assert index.lookup(query, SPEC) == (entry_id, max_distance, 'result')
+
+
+@pytest.mark.parametrize('max_distance', [0, 2, 3, 4, 5, 8])
+def test_miss_beyond_max_distance(max_distance):
+    index = PerceptualIndex(max_distance=max_distance)
+    index.add(BASE, SPEC, 'result')
+
+    assert index.lookup(flip_spread(BASE, max_distance + 1), SPEC) is None
+
+
+def test_lookup_requires_same_spec():
+    index = PerceptualIndex()
+    index.add(BASE, SPEC, 'result')
+
+    assert index.lookup(BASE, filter_spec_key('blur', {'radius': 3.0})) is None
+
+
+def test_closest_then_most_recent_wins():
+    index = PerceptualIndex(max_distance=4)
+    index.add(flip_spread(BASE, 2), SPEC, 'far')
+    index.add(flip_spread(BASE, 1), SPEC, 'near-old')
+    index.add(flip_spread(BASE, 1) ^ (1 << 63) ^ (1 << 62) ^ (1 << 61), SPEC, 'farther')
+    newest = index.add(flip_spread(BASE, 1), SPEC, 'near-new')
+
+    assert index.lookup(BASE, SPEC) == (newest, 1, 'near-new')
+
+
+def test_rejected_closer_candidate_does_not_hide_farther_one():
+    index = PerceptualIndex(max_distance=4)
+    farther = index.add(flip_spread(BASE, 3), SPEC, 'accepted')
+    index.add(BASE, SPEC, 'rejected')
+
+    match = index.lookup(BASE, SPEC, accept=lambda value: value == 'accepted')
+
+    assert match == (farther, 3, 'accepted')
+
+
+def test_eviction_at_max_entries():
+    index = PerceptualIndex(max_entries=3)
+    hashes = [random.Random(i).getrandbits(64) for i in range(4)]
+    ids = [index.add(phash, SPEC, i) for i, phash in enumerate(hashes)]
+
+    assert len(index) == 3
+    assert index.lookup(hashes[0], SPEC) is None
+    for entry_id, phash in zip(ids[1:], hashes[1:]):
+        assert index.lookup(phash, SPEC)[0] == entry_id
+
+    # The evicted entry is gone from every bucket
+    buckets = [entry for table in index._tables[SPEC] for bucket in table.values() for entry in bucket]
+    assert ids[0] not in buckets
+
+
+def test_discard_cleans_buckets_and_spec_table():
+    index = PerceptualIndex()
+    other_spec = filter_spec_key('invert', {})
+    first = index.add(BASE, SPEC, 'a')
+    second = index.add(BASE, SPEC, 'b')
+    only = index.add(BASE, other_spec, 'c')
+
+    index.discard(second)
+    assert index.lookup(BASE, SPEC) == (first, 0, 'a')
+
+    index.discard(first)
+    index.discard(first)  # Discarding twice is harmless
+    assert SPEC not in index._tables
+    assert index.lookup(BASE, SPEC) is None
+
+    index.discard(only)
+    assert index._tables == {}
+    assert len(index) == 0
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        PerceptualIndex(max_distance=-1)
+    with pytest.raises(ValueError):
+        PerceptualIndex(max_entries=0)
+
+
+def test_flat_images_have_uninformative_hashes():
+    phash, _ = compute_fingerprint(Image.new('RGB', (300, 200), 'red'))
+    assert not is_informative_hash(phash)
+
+
+def test_fingerprint_survives_resize_and_reencode():
+    image = textured_image(0)
+    phash, signature = compute_fingerprint(image)
+
+    buffer = io.BytesIO()
+    image.resize((320, 240)).save(buffer, format='JPEG', quality=85)
+    copy_hash, copy_signature = compute_fingerprint(Image.open(buffer))
+
+    assert is_informative_hash(phash)
+    assert (phash ^ copy_hash).bit_count() <= 4
+    assert np.abs(signature.astype(int) - copy_signature.astype(int)).mean() < 6
+
+
+def textured_image(seed: int, size=(640, 480)) -> Image.Image:
+    """Smooth random texture; distinct per seed"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+
+
+@pytest.fixture
+def dedup_client(flask_app, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'DEDUP_ENABLED', True)
+    return flask_app.test_client()
+
+
+def upload(client, image, fmt='PNG', filter_name='invert'):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    ext = 'png' if fmt == 'PNG' else 'jpg'
+    response = client.post('/process', data={
+        'filter': filter_name,
+        'image': (io.BytesIO(buffer.getvalue()), f"upload.{ext}")
+    })
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_process_reuses_reencoded_copy(dedup_client):
+    image = textured_image(1)
+    first = upload(dedup_client, image)
+    second = upload(dedup_client, image, fmt='JPEG')
+    smaller = upload(dedup_client, image.resize((320, 240)), fmt='JPEG')
+
+    assert not first['deduplicated']
+    assert second['deduplicated']
+    assert smaller['deduplicated']
+    assert smaller['original_size'] == '320x240'
+
+
+def test_process_does_not_reuse_recoloured_copy(dedup_client):
+    gray = textured_image(2).convert('L')
+    upload(dedup_client, ImageOps.colorize(gray, 'black', 'red'))
+
+    result = upload(dedup_client, ImageOps.colorize(gray, 'black', 'blue'))
+
+    assert not result['deduplicated']
+
+
+def test_process_does_not_upscale_smaller_result(dedup_client):
+    image = textured_image(3)
+    upload(dedup_client, image.resize((40, 30)))
+
+    result = upload(dedup_client, image.resize((1600, 1200)))
+
+    assert not result['deduplicated']
+
+
+def test_process_does_not_chain_reused_results(dedup_client, flask_app):
+    from app import get_dedup_index
+
+    image = textured_image(4)
+    upload(dedup_client, image)
+    entries = len(get_dedup_index())
+
+    assert upload(dedup_client, image, fmt='JPEG')['deduplicated']
+    assert len(get_dedup_index()) == entries
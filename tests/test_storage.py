@@ -0,0 +1,285 @@
+"""
+Tests for processed-image storage backends
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from storage import FILE_MODE, LocalShardedStorage, S3Storage, create_storage, shard_prefix
+
+
+OLD = time.time() - 2 * 3600
+KEY = '0a1b2c3d-0000-0000-0000-000000000000_invert.png'
+
+
+@pytest.fixture(params=['local', 's3'])
+def backend(request, tmp_path, s3_client):
+    """Yield (storage, backdate) for each backend; backdate(key, ts) sets an object's mtime"""
+    if request.param == 'local':
+        storage = LocalShardedStorage(str(tmp_path / 'processed'))
+
+        def backdate(key, timestamp):
+            os.utime(storage.local_path(key), (timestamp, timestamp))
+    else:
+        storage = S3Storage(s3_client, 'results')
+
+        def backdate(key, timestamp):
+            s3_client.set_last_modified('results', storage.object_key(key), timestamp)
+
+    return storage, backdate
+
+
+def test_put_get_roundtrip(backend):
+    storage, _ = backend
+    storage.put(KEY, b'image-bytes')
+
+    assert storage.exists(KEY)
+    assert storage.get(KEY) == b'image-bytes'
+
+
+def test_put_overwrites(backend):
+    storage, _ = backend
+    storage.put(KEY, b'first')
+    storage.put(KEY, b'second')
+
+    assert storage.get(KEY) == b'second'
+    assert storage.usage() == (1, len(b'second'))
+
+
+def test_missing_key(backend):
+    storage, _ = backend
+
+    assert not storage.exists(KEY)
+    with pytest.raises(KeyError):
+        storage.get(KEY)
+    storage.delete(KEY)  # No error for missing objects
+
+
+@pytest.mark.parametrize('key', ['', '../etc/passwd', 'a/b.png', '.hidden'])
+def test_invalid_keys_rejected(backend, key):
+    storage, _ = backend
+    with pytest.raises(ValueError):
+        storage.put(key, b'x')
+
+
+def test_usage_counts_all_objects(backend):
+    storage, _ = backend
+    for i in range(5):  # More than one listing page for S3
+        storage.put(f"{i}_blur.jpg", b'x' * (i + 1))
+
+    assert storage.usage() == (5, 1 + 2 + 3 + 4 + 5)
+    assert sorted(key for key, _, _ in storage.iter_objects()) == [f"{i}_blur.jpg" for i in range(5)]
+
+
+def test_cleanup_removes_only_old_objects(backend):
+    storage, backdate = backend
+    storage.put('old_blur.jpg', b'old')
+    storage.put('new_blur.jpg', b'new')
+    backdate('old_blur.jpg', OLD)
+
+    removed = storage.cleanup(time.time() - 3600)
+
+    assert removed == ['old_blur.jpg']
+    assert not storage.exists('old_blur.jpg')
+    assert storage.get('new_blur.jpg') == b'new'
+    assert storage.usage() == (1, 3)
+
+
+def test_sweep_reports_remaining_usage(backend):
+    storage, backdate = backend
+    storage.put('old_blur.jpg', b'old')
+    storage.put('new_blur.jpg', b'newer')
+    backdate('old_blur.jpg', OLD)
+
+    removed, usage = storage.sweep(time.time() - 3600)
+
+    assert removed == ['old_blur.jpg']
+    assert usage == (1, 5)
+
+
+def test_local_layout_is_sharded(tmp_path):
+    storage = LocalShardedStorage(str(tmp_path))
+    storage.put(KEY, b'data')
+
+    expected = tmp_path / shard_prefix(KEY, 1) / KEY
+    assert storage.local_path(KEY) == str(expected)
+    assert expected.read_bytes() == b'data'
+    assert len(shard_prefix(KEY, 1)) == 2  # One level of 256 shards
+
+
+def test_local_files_get_default_mode(tmp_path):
+    storage = LocalShardedStorage(str(tmp_path))
+    storage.put(KEY, b'data')
+    plain = tmp_path / 'plain'
+    with open(plain, 'wb') as f:
+        f.write(b'data')
+
+    mode = os.stat(storage.local_path(KEY)).st_mode & 0o777
+    assert mode == FILE_MODE
+    assert mode == os.stat(plain).st_mode & 0o777
+
+
+def test_local_put_leaves_no_temp_files(tmp_path):
+    storage = LocalShardedStorage(str(tmp_path))
+    storage.put(KEY, b'data')
+
+    shard_dir = tmp_path / shard_prefix(KEY, 1)
+    assert os.listdir(shard_dir) == [KEY]
+
+
+def test_local_failed_write_keeps_previous_file(tmp_path, monkeypatch):
+    storage = LocalShardedStorage(str(tmp_path))
+    storage.put(KEY, b'good')
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, 'replace', failing_replace)
+
+    with pytest.raises(OSError):
+        storage.put(KEY, b'partial')
+
+    monkeypatch.undo()
+    assert storage.get(KEY) == b'good'
+    assert os.listdir(tmp_path / shard_prefix(KEY, 1)) == [KEY]
+
+
+def test_local_legacy_flat_files(tmp_path):
+    storage = LocalShardedStorage(str(tmp_path))
+    legacy = tmp_path / KEY
+    legacy.write_bytes(b'legacy')
+
+    assert storage.exists(KEY)
+    assert storage.get(KEY) == b'legacy'
+    assert storage.local_path(KEY) == str(legacy)
+    assert storage.usage() == (1, 6)
+
+    os.utime(legacy, (0, 0))
+    assert storage.cleanup(time.time() - 3600) == [KEY]
+    assert not legacy.exists()
+
+
+def test_local_cleanup_sweeps_orphaned_temp_files(tmp_path):
+    storage = LocalShardedStorage(str(tmp_path))
+    storage.put(KEY, b'data')
+    shard_dir = tmp_path / shard_prefix(KEY, 1)
+    stale = shard_dir / f"{LocalShardedStorage.TEMP_PREFIX}crashed"
+    fresh = shard_dir / f"{LocalShardedStorage.TEMP_PREFIX}writing"
+    stale.write_bytes(b'partial')
+    fresh.write_bytes(b'partial')
+    os.utime(stale, (OLD, OLD))
+
+    # Temp files are never reported as objects
+    assert storage.usage() == (1, 4)
+
+    assert storage.cleanup(time.time() - 3600) == []
+    assert not stale.exists()
+    assert fresh.exists()
+    assert storage.exists(KEY)
+
+
+def test_s3_object_keys_are_sharded_under_prefix(s3_client):
+    storage = S3Storage(s3_client, 'results', prefix='/processed/')
+    storage.put(KEY, b'data')
+
+    assert list(s3_client.buckets['results']) == [f"processed/{shard_prefix(KEY)}/{KEY}"]
+
+
+def test_s3_listing_ignores_other_prefixes(s3_client):
+    s3_client.put_object(Bucket='results', Key='other/file.png', Body=b'x')
+    storage = S3Storage(s3_client, 'results')
+    storage.put(KEY, b'data')
+
+    assert storage.usage() == (1, 4)
+
+
+def test_s3_cleanup_deletes_in_batches(s3_client):
+    s3_client.page_size = 1000
+    storage = S3Storage(s3_client, 'results')
+    for i in range(2500):
+        storage.put(f"{i}_old.jpg", b'x')
+    storage.put('new.jpg', b'new')
+    for i in range(2500):
+        s3_client.set_last_modified('results', storage.object_key(f"{i}_old.jpg"), OLD)
+
+    removed, usage = storage.sweep(time.time() - 3600)
+
+    assert len(removed) == 2500
+    assert s3_client.delete_objects_calls == 3
+    assert usage == (1, 3)
+    assert storage.usage() == (1, 3)
+
+
+def test_s3_cleanup_skips_failed_deletes(s3_client):
+    storage = S3Storage(s3_client, 'results')
+    for key in ('a_old.jpg', 'b_old.jpg'):
+        storage.put(key, b'x')
+        s3_client.set_last_modified('results', storage.object_key(key), OLD)
+    s3_client.fail_deletes.add(storage.object_key('b_old.jpg'))
+
+    assert storage.cleanup(time.time() - 3600) == ['a_old.jpg']
+    assert storage.exists('b_old.jpg')
+
+
+def test_s3_unexpected_errors_propagate(s3_client, monkeypatch):
+    from conftest import FakeClientError
+
+    def denied(**kwargs):
+        raise FakeClientError('AccessDenied')
+    monkeypatch.setattr(s3_client, 'get_object', denied)
+    monkeypatch.setattr(s3_client, 'head_object', denied)
+    storage = S3Storage(s3_client, 'results')
+
+    with pytest.raises(FakeClientError):
+        storage.get(KEY)
+    with pytest.raises(FakeClientError):
+        storage.exists(KEY)
+
+
+def test_create_storage_local(tmp_path):
+    storage = create_storage({'STORAGE_BACKEND': 'local', 'PROCESSED_FOLDER': str(tmp_path)})
+    assert isinstance(storage, LocalShardedStorage)
+
+
+def test_create_storage_rejects_bad_config(tmp_path):
+    with pytest.raises(ValueError):
+        create_storage({'STORAGE_BACKEND': 'ftp', 'PROCESSED_FOLDER': str(tmp_path)})
+    with pytest.raises(ValueError):
+        create_storage({'STORAGE_BACKEND': 's3', 'S3_BUCKET': None})
+
+
+def test_stats_never_scans_in_request(flask_app, monkeypatch):
+    import app as app_module
+
+    storage = app_module.get_storage()
+    release = threading.Event()
+    scans = []
+
+    def slow_usage():
+        scans.append(1)
+        release.wait(5)
+        return (7, 7 * 1024 * 1024)
+    monkeypatch.setattr(storage, 'usage', slow_usage)
+    monkeypatch.setitem(app_module.usage_cache, 'time', None)
+    monkeypatch.setitem(app_module.usage_cache, 'value', (0, 0))
+    client = flask_app.test_client()
+
+    start = time.time()
+    first = client.get('/stats').get_json()
+    second = client.get('/stats').get_json()
+    assert time.time() - start < 2  # Neither request waited for the scan
+    assert first['files']['processed'] == 0
+    assert first['storage']['processed_measured_at'] is None
+    assert second['files']['processed'] == 0
+
+    release.set()
+    deadline = time.time() + 5
+    while app_module.usage_cache['time'] is None and time.time() < deadline:
+        time.sleep(0.01)
+
+    third = client.get('/stats').get_json()
+    assert third['files']['processed'] == 7
+    assert third['storage']['processed_measured_at'] is not None
+    assert len(scans) == 1  # Concurrent requests started a single scan